@@ -1,7 +1,6 @@
-from functools import lru_cache
+from functools import cached_property, lru_cache
 from pathlib import Path
 
-from dotenv import load_dotenv
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 ROOTDIR = Path(__file__).parent
@@ -18,26 +17,31 @@ class Settings(BaseSettings):
     PORT: int = 8001
     DEBUG: bool = False
     LOG_LEVEL: str = "info"
+    WORKERS: int = 1
 
-    # CORS Configuration
-    CORS_ORIGINS: str = "*"
+    # CORS Configuration (comma-separated list of concrete origins; avoid "*"
+    # in production - it is invalid with allow_credentials and forces
+    # per-request wildcard matching in the middleware)
+    CORS_ORIGINS: str = "http://localhost:3000"
 
     # Anthropic Configuration
     ANTHROPIC_API_KEY: str
     ANTHROPIC_MODEL: str = "claude-sonnet-4-5-20250929"
     MAX_TOKENS: int = 4096
+    # Ceiling on concurrent Anthropic streams; keep below the account RPM cap
+    MAX_CONCURRENCY: int = 10
 
     # ScrapingBee Configuration
     SCRAPINGBEE_API_KEY: str
 
-    @property
+    @cached_property
     def cors_origins_list(self) -> list[str]:
         return [origin.strip() for origin in self.CORS_ORIGINS.split(",")]
 
 
-@lru_cache
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    load_dotenv()
+    # pydantic-settings reads .env itself via SettingsConfigDict(env_file=".env")
     return Settings()  # type: ignore[call-arg]
 
 
@@ -0,0 +1,8 @@
+from typing import Any
+
+import orjson
+
+
+# Thin orjson wrapper so hot-path serialization shares one configuration
+def dumps(obj: Any) -> str:
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
@@ -1,18 +1,22 @@
-import json
+import asyncio
+import logging
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 from typing import Any, Optional
 
 import uvicorn
-from anthropic import AsyncAnthropic
+from anthropic import AsyncAnthropic, Timeout
 from assistant_stream import create_run
 from assistant_stream.serialization import DataStreamResponse
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import TypeAdapter, ValidationError
 
 from config import settings
+from json_utils import dumps as json_dumps
 from models import ChatRequest
 from tools import execute_tool, get_tools
+from tools import http_client as scrape_http_client
 from utils import (
     convert_langchain_to_anthropic,
     create_ai_message,
@@ -20,47 +24,96 @@ from utils import (
     create_tool_message,
 )
 
+logger = logging.getLogger(__name__)
+
+# Coalesce streamed text into chunks of at least this many characters before
+# emitting, so per-delta state/serialization work is amortized over a few
+# tokens without a user-visible stutter
+TEXT_DELTA_FLUSH_CHARS = 64
+
+# Built once so request bodies validate straight from bytes in pydantic-core,
+# skipping the json.loads -> dict -> model_validate round-trip
+CHAT_REQUEST_ADAPTER = TypeAdapter(ChatRequest)
+
+# Shared Anthropic client so TCP/TLS connections are reused across requests
+# instead of paying a fresh handshake on every chat turn
+anthropic_client = AsyncAnthropic(
+    max_retries=2,
+    timeout=Timeout(60.0, connect=5.0),
+)
+
+# Bound concurrent upstream streams so a client burst degrades to queueing
+# here instead of 429s and retry latency at Anthropic
+anthropic_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENCY)
+
 
 async def run_agent(
     messages: list[dict[str, Any]],
     tools: list[dict[str, Any]],
     system: Optional[str] = None,
 ) -> AsyncGenerator[tuple[str, Any], None]:
-    client = AsyncAnthropic()
+    client = anthropic_client
 
-    while True:
-        # Build the API request
-        request_kwargs = {
-            "model": settings.ANTHROPIC_MODEL,
-            "max_tokens": settings.MAX_TOKENS,
-            "messages": messages,
-        }
+    # Build the invariant request kwargs once; only messages changes per iteration
+    base_kwargs: dict[str, Any] = {
+        "model": settings.ANTHROPIC_MODEL,
+        "max_tokens": settings.MAX_TOKENS,
+    }
 
-        if tools:
-            request_kwargs["tools"] = tools
+    if tools:
+        base_kwargs["tools"] = tools
+        # Explicit default: allow Claude to emit parallel tool_use blocks
+        base_kwargs["tool_choice"] = {"type": "auto", "disable_parallel_tool_use": False}
 
-        if system:
-            request_kwargs["system"] = system
+    if system:
+        base_kwargs["system"] = system
 
+    while True:
         # Track tool calls in the current response
         current_tool_calls: dict[int, dict[str, Any]] = {}
         text_content = ""
-
-        # Stream the response
-        async with client.messages.stream(**request_kwargs) as stream:  # type: ignore[arg-type]
+        # Text accumulated since the last flush downstream
+        pending_text = ""
+
+        # Stream the response, holding a concurrency slot for its duration
+        async with (
+            anthropic_semaphore,
+            client.messages.stream(
+                messages=messages,  # type: ignore[arg-type]
+                **base_kwargs,
+            ) as stream,
+        ):
             async for event in stream:
-                # Handle text deltas
+                # Handle text deltas (single getattr instead of two hasattr probes)
                 if event.type == "content_block_delta":
-                    if hasattr(event.delta, "text"):
-                        text_content += event.delta.text
-                        yield ("text_delta", event.delta.text)
-                    elif hasattr(event.delta, "partial_json"):
-                        # Tool input is being streamed - accumulate it
-                        pass
+                    delta_text = getattr(event.delta, "text", None)
+                    if delta_text is not None:
+                        text_content += delta_text
+                        pending_text += delta_text
+                        if len(pending_text) >= TEXT_DELTA_FLUSH_CHARS:
+                            yield ("text_delta", pending_text)
+                            pending_text = ""
+                    else:
+                        # Tool input streams as partial_json - forward it so the
+                        # frontend sees args before the message completes
+                        partial_json = getattr(event.delta, "partial_json", None)
+                        if partial_json:
+                            tool_call = current_tool_calls.get(event.index)
+                            if tool_call:
+                                if pending_text:
+                                    yield ("text_delta", pending_text)
+                                    pending_text = ""
+                                yield (
+                                    "tool_args_delta",
+                                    {"id": tool_call["id"], "partial_json": partial_json},
+                                )
 
                 # Handle content block start (text or tool_use)
                 elif event.type == "content_block_start":
                     if event.content_block.type == "tool_use":
+                        if pending_text:
+                            yield ("text_delta", pending_text)
+                            pending_text = ""
                         tool_id = event.content_block.id
                         tool_name = event.content_block.name
                         current_tool_calls[event.index] = {
@@ -70,26 +123,33 @@ async def run_agent(
                         }
                         yield ("tool_call_start", {"id": tool_id, "name": tool_name})
 
-            # Get the final message to extract complete tool calls
-            final_message = await stream.get_final_message()
+                # Nothing useful follows message_stop; stop iterating instead
+                # of draining trailing SSE frames
+                elif event.type == "message_stop":
+                    break
 
-        # Extract tool calls from the final message
-        tool_use_blocks = [block for block in final_message.content if block.type == "tool_use"]
+            # Flush whatever text remains before finalizing the message
+            if pending_text:
+                yield ("text_delta", pending_text)
+                pending_text = ""
 
-        if not tool_use_blocks:
-            # No tool calls - we're done
-            break
+            # Text-only response (the common case): everything below exists
+            # to service tool calls, so skip the final-message re-parse
+            if not current_tool_calls:
+                break
 
-        # Yield complete tool call arguments
-        for block in tool_use_blocks:
-            yield ("tool_call_args", {"id": block.id, "name": block.name, "args": block.input})
+            # Get the final message to extract complete tool calls
+            final_message = await stream.get_final_message()
 
-        # Add assistant message to history (with both text and tool_use blocks)
+        # Single pass over the final message: collect tool_use blocks and
+        # build the assistant history content at the same time
+        tool_use_blocks = []
         assistant_content: list[dict[str, Any]] = []
         for content_block in final_message.content:
             if content_block.type == "text":
                 assistant_content.append({"type": "text", "text": content_block.text})
             elif content_block.type == "tool_use":
+                tool_use_blocks.append(content_block)
                 assistant_content.append(
                     {
                         "type": "tool_use",
@@ -99,18 +159,34 @@ async def run_agent(
                     }
                 )
 
+        if not tool_use_blocks:
+            # No tool calls - we're done
+            break
+
+        # Yield complete tool call arguments
+        for block in tool_use_blocks:
+            yield ("tool_call_args", {"id": block.id, "name": block.name, "args": block.input})
+
+        # Add assistant message to history (with both text and tool_use blocks)
         messages.append({"role": "assistant", "content": assistant_content})
 
-        # Execute tools and collect results
+        # Execute tools concurrently and collect results in block order
+        results = await asyncio.gather(
+            *(execute_tool(block.name, block.input) for block in tool_use_blocks),
+            return_exceptions=True,
+        )
         tool_results = []
-        for block in tool_use_blocks:
-            result = await execute_tool(block.name, block.input)
+        for block, result in zip(tool_use_blocks, results):
+            if isinstance(result, BaseException):
+                result = {"error": str(result)}
             yield ("tool_result", {"id": block.id, "name": block.name, "result": result})
             tool_results.append(
                 {
                     "type": "tool_result",
                     "tool_use_id": block.id,
-                    "content": json.dumps(result) if isinstance(result, dict) else str(result),
+                    "content": (
+                        json_dumps(result) if isinstance(result, (dict, list)) else str(result)
+                    ),
                 }
             )
 
@@ -120,9 +196,11 @@ async def run_agent(
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Starting Japanai Mercari Search Backend (Direct Anthropic SDK)...")
+    logger.info("Starting Japanai Mercari Search Backend (Direct Anthropic SDK)...")
     yield
-    print("Shutting down Japanai Mercari Search Backend...")
+    await anthropic_client.close()
+    await scrape_http_client.aclose()
+    logger.info("Shutting down Japanai Mercari Search Backend...")
 
 
 # Create FastAPI app
@@ -133,19 +211,30 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-# Configure CORS
+# Configure CORS with concrete origins/headers so the middleware can use
+# set-membership checks instead of wildcard matching on every request
 cors_origins = settings.cors_origins_list
 app.add_middleware(
     CORSMiddleware,
     allow_origins=cors_origins,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
-    allow_headers=["*"],
+    # Test-Header is set by the frontend runtime provider on every request
+    allow_headers=["Content-Type", "Authorization", "Accept", "Test-Header"],
 )
 
 
 @app.post("/assistant")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(raw_request: Request):
+    # Shed load up front rather than queueing a stream that cannot start
+    if anthropic_semaphore.locked():
+        raise HTTPException(status_code=503, detail="Server at capacity, retry shortly")
+
+    try:
+        request = CHAT_REQUEST_ADAPTER.validate_json(await raw_request.body())
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors()) from e
+
     async def run_callback(controller):
         # Initialize controller state if needed
         if controller.state is None:
@@ -153,26 +242,33 @@ async def chat_endpoint(request: ChatRequest):
         if "messages" not in controller.state:
             controller.state["messages"] = []
 
+        # Flush the initial state ops now so response headers and first bytes
+        # reach the client before we wait on Anthropic's first token
+        controller.flush()
+
         # Build input messages in Anthropic format for the SDK
         input_messages = []
         # Process commands
         for command in request.commands:
             if command.type == "add-message":
-                # Extract text from parts
-                text_parts = [
-                    part.text for part in command.message.parts if part.type == "text" and part.text
-                ]
-                if text_parts:
-                    text = " ".join(text_parts)
+                # Extract text from parts; the common case is a single text
+                # part, which needs no join at all
+                parts = command.message.parts
+                if len(parts) == 1 and parts[0].type == "text":
+                    text = parts[0].text or ""
+                else:
+                    text = " ".join(
+                        part.text for part in parts if part.type == "text" and part.text
+                    )
+                if text:
                     # Add to input_messages in Anthropic format for SDK
                     input_messages.append({"role": "user", "content": text})
                     # Add to state in LangChain format for frontend
                     controller.state["messages"].append(create_human_message(text))
             elif command.type == "add-tool-result":
                 # Handle tool results from frontend-executed tools
-                print("Adding tool result to conversation")
-                print(f"Tool Result: {command.result}")
-                result_content = json.dumps(command.result)
+                logger.debug("Adding tool result to conversation: %s", command.result)
+                result_content = json_dumps(command.result)
                 # Add to input_messages in Anthropic format for SDK
                 input_messages.append(
                     {
@@ -191,30 +287,45 @@ async def chat_endpoint(request: ChatRequest):
                     create_tool_message(command.tool_call_id, result_content)
                 )
 
-        # Convert existng conversation history to Anthropic format
-        # and prepend to input_messages for full context
-        # Note: controller.state["messages"] is a proxy object, convert to list for slicing
-        state_messages = list(controller.state["messages"])
-        num_new_messages = len(input_messages)
-        if num_new_messages > 0:
-            # Exclude the newly added mesages from history (they're in input_messages)
-            history = state_messages[:-num_new_messages]
+        # Reuse the Anthropic-format history cached from previous turns;
+        # fall back to converting the LangChain state once (e.g. first turn
+        # or state from an older frontend without the cache)
+        if "_anthropic_cache" in controller.state:
+            history_messages = list(controller.state["_anthropic_cache"])
         else:
-            # No new messaes added, use full state as history
-            history = state_messages
-        history_messages = convert_langchain_to_anthropic(history)
+            # Note: controller.state["messages"] is a proxy object, convert to list for slicing
+            state_messages = list(controller.state["messages"])
+            num_new_messages = len(input_messages)
+            if num_new_messages > 0:
+                # Exclude the newly added mesages from history (they're in input_messages)
+                history = state_messages[:-num_new_messages]
+            else:
+                # No new messaes added, use full state as history
+                history = state_messages
+            # Pure-Python conversion; run it off the event loop so long
+            # histories don't stall other in-flight streams
+            history_messages = await asyncio.to_thread(convert_langchain_to_anthropic, history)
         full_messages = history_messages + input_messages
-        print(
-            f"Full conversation: {len(history_messages)} history + "
-            f"{len(input_messages)} new = {len(full_messages)} total"
+        logger.debug(
+            "Full conversation: %d history + %d new = %d total",
+            len(history_messages),
+            len(input_messages),
+            len(full_messages),
         )
 
         # Track current tool call for streaming
         current_tool_call = None
         # Track the current assstant message for LangChain format
         current_ai_message_index = None
+        # Proxy reference to that message, held so each event avoids the
+        # double subscript through the state proxy
+        current_ai_msg = None
         current_ai_text = ""
         current_tool_calls = []
+        # Same entry dicts as current_tool_calls, indexed by id for O(1) lookup
+        current_tool_calls_by_id = {}
+        # IDs of tool calls whose args were already streamed as partial_json
+        streamed_args_ids = set()
 
         # Run the agent loop with full conversation history
         async for event_type, data in run_agent(full_messages, get_tools(), request.system):
@@ -223,10 +334,14 @@ async def chat_endpoint(request: ChatRequest):
                 if current_ai_message_index is None:
                     current_ai_message_index = len(controller.state["messages"])
                     controller.state["messages"].append(create_ai_message(""))
+                    current_ai_msg = controller.state["messages"][current_ai_message_index]
 
-                # Accumuate text and update state
+                # Stream the delta as an append-text op instead of rewriting
+                # the whole content string on every token
                 current_ai_text += data
-                controller.state["messages"][current_ai_message_index]["content"] = current_ai_text
+                controller.append_state_text(
+                    ["messages", current_ai_message_index, "content"], data
+                )
 
             elif event_type == "tool_call_start":
                 # Start a new tool call
@@ -236,26 +351,33 @@ async def chat_endpoint(request: ChatRequest):
                 if current_ai_message_index is None:
                     current_ai_message_index = len(controller.state["messages"])
                     controller.state["messages"].append(create_ai_message(""))
+                    current_ai_msg = controller.state["messages"][current_ai_message_index]
 
-                # Add tool call placeholder to the list
-                current_tool_calls.append({"id": data["id"], "name": data["name"], "args": {}})
+                # Add tool call placeholder to the list and the id index
+                tool_call_entry = {"id": data["id"], "name": data["name"], "args": {}}
+                current_tool_calls.append(tool_call_entry)
+                current_tool_calls_by_id[data["id"]] = tool_call_entry
                 # Update state with tool_calls
-                msg = controller.state["messages"][current_ai_message_index]
-                msg["tool_calls"] = current_tool_calls
+                current_ai_msg["tool_calls"] = current_tool_calls
 
-            elif event_type == "tool_call_args":
-                # Stream args as JSON text
+            elif event_type == "tool_args_delta":
+                # Forward raw partial_json to the frontend as it arrives
                 if current_tool_call:
-                    current_tool_call.append_args_text(json.dumps(data["args"]))
+                    current_tool_call.append_args_text(data["partial_json"])
+                    streamed_args_ids.add(data["id"])
+
+            elif event_type == "tool_call_args":
+                # Stream args as JSON text unless partial_json deltas already
+                # delivered them (e.g. tools invoked with empty input)
+                if current_tool_call and data["id"] not in streamed_args_ids:
+                    current_tool_call.append_args_text(json_dumps(data["args"]))
 
                 # Update the tool call args in state
-                for tc in current_tool_calls:
-                    if tc["id"] == data["id"]:
-                        tc["args"] = data["args"]
-                        break
-                if current_ai_message_index is not None:
-                    msg = controller.state["messages"][current_ai_message_index]
-                    msg["tool_calls"] = current_tool_calls
+                tc = current_tool_calls_by_id.get(data["id"])
+                if tc is not None:
+                    tc["args"] = data["args"]
+                if current_ai_msg is not None:
+                    current_ai_msg["tool_calls"] = current_tool_calls
 
             elif event_type == "tool_result":
                 # Set the tool result
@@ -265,30 +387,65 @@ async def chat_endpoint(request: ChatRequest):
 
                 # Add tool result to state in LangChain format
                 result = data["result"]
-                result_content = json.dumps(result) if isinstance(result, dict) else str(result)
+                result_content = (
+                    json_dumps(result) if isinstance(result, (dict, list)) else str(result)
+                )
                 controller.state["messages"].append(create_tool_message(data["id"], result_content))
 
                 # Reset for next assistant turn
                 current_ai_message_index = None
+                current_ai_msg = None
                 current_ai_text = ""
                 current_tool_calls = []
+                current_tool_calls_by_id = {}
+
+        # run_agent appended the intermediate assistant/tool turns to
+        # full_messages in place; add the final text-only assistant turn and
+        # persist the Anthropic-format history for the next request
+        if current_ai_text:
+            full_messages.append({"role": "assistant", "content": current_ai_text})
+        controller.state["_anthropic_cache"] = full_messages
 
     # Create streaming response using assistant-stream
     stream = create_run(run_callback, state=request.state)
-    return DataStreamResponse(stream)
+    response = DataStreamResponse(stream)
+    # Keep reverse proxies (nginx/CDNs) from buffering the token stream
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["Cache-Control"] = "no-cache, no-transform"
+    return response
 
 
 def main():
-    print(f"Starting Japanai Mercari Search Backend on {settings.HOST}:{settings.PORT}")
-    print(f"Debug mode: {settings.DEBUG}")
+    logging.basicConfig(level=settings.LOG_LEVEL.upper())
+
+    try:
+        import uvloop  # noqa: F401
+
+        loop_impl = "uvloop"
+    except ImportError:
+        # uvloop is unavailable on Windows dev machines; fall back to asyncio
+        loop_impl = "asyncio"
+    logger.info(
+        "Starting Japanai Mercari Search Backend on %s:%d (debug=%s)",
+        settings.HOST,
+        settings.PORT,
+        settings.DEBUG,
+    )
 
     uvicorn.run(
         "main:app",
         host=settings.HOST,
         port=settings.PORT,
         reload=settings.DEBUG,
+        # Ignored when reload is enabled; scale out in production via WORKERS
+        workers=settings.WORKERS,
         log_level=settings.LOG_LEVEL.lower(),
-        access_log=True,
+        # Access-log formatting per request is pure overhead in production
+        access_log=settings.DEBUG,
+        # uvicorn[standard] ships uvloop + httptools; use them for lower
+        # per-chunk overhead on the streaming hot path
+        loop=loop_impl,
+        http="httptools",
     )
 
 
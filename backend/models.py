@@ -1,4 +1,4 @@
-from typing import Any, Optional, Union
+from typing import Annotated, Any, Literal, Optional, Union
 
 from pydantic import BaseModel, ConfigDict, Field
 
@@ -15,25 +15,29 @@ class UserMessage(BaseModel):
 
 
 class AddMessageCommand(BaseModel):
-    type: str = Field(default="add-message", description="Command type")
+    type: Literal["add-message"] = Field(default="add-message", description="Command type")
     message: UserMessage = Field(..., description="User message")
 
 
 class AddToolResultCommand(BaseModel):
-    model_config = ConfigDict(populate_by_name=True)
+    model_config = ConfigDict(populate_by_name=True, extra="ignore")
 
-    type: str = Field(default="add-tool-result", description="Command type")
+    type: Literal["add-tool-result"] = Field(default="add-tool-result", description="Command type")
     tool_call_id: str = Field(..., alias="toolCallId", description="ID of the tool call")
     tool_name: Optional[str] = Field(None, alias="toolName", description="Name of the tool")
     result: dict[str, Any] = Field(..., description="Tool execution result")
 
 
 class ChatRequest(BaseModel):
-    model_config = ConfigDict(populate_by_name=True)
-
-    commands: list[Union[AddMessageCommand, AddToolResultCommand]] = Field(
-        ..., description="List of commands to execute"
-    )
+    # extra="ignore" is pydantic's default; stated explicitly so unknown
+    # frontend fields never grow into hot-path validation errors
+    model_config = ConfigDict(populate_by_name=True, extra="ignore")
+
+    # Tagged union so pydantic-core dispatches on "type" instead of trying
+    # each command schema in turn
+    commands: list[
+        Annotated[Union[AddMessageCommand, AddToolResultCommand], Field(discriminator="type")]
+    ] = Field(..., description="List of commands to execute")
     system: Optional[str] = Field(None, description="System prompt")
     tools: Optional[dict[str, Any]] = Field(None, description="Available tools")
     run_config: Optional[dict[str, Any]] = Field(
@@ -1,18 +1,38 @@
 import hashlib
 import re
 import urllib.parse
+from functools import lru_cache
 from typing import Any
 
-from bs4 import BeautifulSoup
-from scrapingbee import ScrapingBeeClient
+import httpx
+from selectolax.parser import HTMLParser
 
 from config import settings
 from models import SearchProductsInput
 
+SCRAPINGBEE_API_URL = "https://app.scrapingbee.com/api/v1/"
+
+# Shared async client so TLS connections to ScrapingBee are pooled and the
+# scrape never blocks the event loop; closed from the app lifespan hook
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(60.0, connect=5.0),
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+)
+
+_MERCARI_BASE = "https://jp.mercari.com"
+_ITEM_URL_PREFIX = _MERCARI_BASE + "/item/"
+
+# Candidate img attributes in preference order; lazy-loaded cards park the
+# real URL in data-src / data-lazy-src
+_IMG_ATTRS = ("src", "data-src", "data-lazy-src")
+
+# Compiled once; runs per product row in the scrape loop
+_NON_DIGITS_RE = re.compile(r"[^\d]")
+
 
 def _extract_price(price_text: str) -> int:
     # Extract just the numbers (remove commas, spaces, etc.)
-    cleaned = re.sub(r"[^\d]", "", price_text)
+    cleaned = _NON_DIGITS_RE.sub("", price_text)
     try:
         return int(cleaned) if cleaned else 0
     except ValueError:
@@ -20,8 +40,9 @@ def _extract_price(price_text: str) -> int:
 
 
 async def search_products(query: str, limit: int = 3) -> dict:
-    # Generate a unique surface ID based on the query
-    query_hash = hashlib.md5(query.encode()).hexdigest()[:8]
+    # Generate a unique surface ID based on the query; blake2b with a 4-byte
+    # digest gives the same 8-hex-char key without md5's setup cost
+    query_hash = hashlib.blake2b(query.encode(), digest_size=4).hexdigest()
 
     # Define columns for the DataTable
     columns = [
@@ -39,19 +60,18 @@ async def search_products(query: str, limit: int = 3) -> dict:
         },
     ]
 
-    api_key = settings.SCRAPINGBEE_API_KEY
     try:
-        client = ScrapingBeeClient(api_key=api_key)
-
         # Scrape Mercari Japan search page with JS rendering
         encoded_query = urllib.parse.quote(query)
         search_url = f"https://jp.mercari.com/search?keyword={encoded_query}&status=on_sale"
 
-        response = client.get(
-            search_url,
+        response = await http_client.get(
+            SCRAPINGBEE_API_URL,
             params={
+                "api_key": settings.SCRAPINGBEE_API_KEY,
+                "url": search_url,
                 "render_js": "true",
-                "wait": 5000, 
+                "wait": "5000",
                 "premium_proxy": "true",  # Required for geolocation
                 "country_code": "jp",  # Japan proxy for JPY prices
             },
@@ -65,72 +85,80 @@ async def search_products(query: str, limit: int = 3) -> dict:
                 "error": f"ScrapingBee error: {response.status_code}",
             }
 
-        # Parse HTML with BeautifulSoup
-        soup = BeautifulSoup(response.content, "html.parser")
+        # Parse HTML with selectolax (Lexbor C parser)
+        tree = HTMLParser(response.content)
         products: list[dict[str, Any]] = []
 
-        # Find product links - Mercari uses anchor tags with /item/ in href
-        product_links = soup.select('a[href*="/item/"]')
+        # Scope selection to the product-grid region when present; most of
+        # Mercari's search page contains no product cards
+        container = tree.css_first('#item-grid, [data-testid="search-item-grid"], main')
+        search_root = container if container is not None else tree
 
-        seen_ids = set()
+        # Find product links - Mercari uses anchor tags with /item/ in href
+        product_links = search_root.css('a[href*="/item/"]')
+
+        seen_ids: set[str] = set()
+        # Bind loop invariants as locals; LOAD_FAST beats the repeated
+        # global/attribute lookups across up to len(product_links) rows
+        append_product = products.append
+        mark_seen = seen_ids.add
+        extract_price = _extract_price
         for link in product_links:
             if len(products) >= limit:
                 break
 
-            href_attr = link.get("href", "")
+            href_attr = link.attributes.get("href", "")
             href = str(href_attr) if href_attr else ""
             if "/item/" not in href:
                 continue
 
-            item_id = href.split("/item/")[-1].split("?")[0]
+            # partition avoids the two intermediate lists split would allocate
+            item_id = href.rpartition("/item/")[2].partition("?")[0]
 
             # Skip duplicates
             if item_id in seen_ids:
                 continue
-            seen_ids.add(item_id)
+            mark_seen(item_id)
 
             # Extract product name from the link or its children
             name = ""
             # Try to find a span or div with product name
-            name_elem = link.select_one('[class*="itemName"], [class*="name"]')
+            name_elem = link.css_first('[class*="itemName"], [class*="name"]')
             if name_elem:
-                name = name_elem.get_text(strip=True)
+                name = name_elem.text(strip=True)
             else:
-                name = link.get_text(strip=True)
+                name = link.text(strip=True)
 
             # Extract image URL
             image_url = ""
-            img_elem = link.select_one("img")
+            img_elem = link.css_first("img")
             if img_elem:
-                img_src = (
-                    img_elem.get("src") or img_elem.get("data-src") or img_elem.get("data-lazy-src")
-                )
-                image_url = str(img_src) if img_src else ""
-                # Handle relative URLs
-                if image_url and not image_url.startswith("http"):
-                    if image_url.startswith("//"):
-                        image_url = f"https:{image_url}"
-                    elif image_url.startswith("/"):
-                        image_url = f"https://jp.mercari.com{image_url}"
+                img_attrs = img_elem.attributes
+                image_url = next((src for attr in _IMG_ATTRS if (src := img_attrs.get(attr))), "")
+                # Handle relative URLs; slicing sidesteps a startswith call
+                if image_url[:2] == "//":
+                    image_url = "https:" + image_url
+                elif image_url[:1] == "/":
+                    image_url = _MERCARI_BASE + image_url
 
             # Try to extract price from merPrice span
             price = 0
             is_auction = False
-            price_elem = link.select_one('span[class*="merPrice"]')
+            price_elem = link.css_first('span[class*="merPrice"]')
             if price_elem:
                 # Check if this is an auction item (現在 = "current bid")
-                currency_elem = price_elem.select_one('span[class*="currency__"]')
+                currency_elem = price_elem.css_first('span[class*="currency__"]')
                 if currency_elem:
-                    currency_text = currency_elem.get_text(strip=True)
+                    currency_text = currency_elem.text(strip=True)
                     is_auction = "現在" in currency_text
 
                 # Target the number span directly for more reliable extraction
-                number_elem = price_elem.select_one('span[class*="number__"]')
+                number_elem = price_elem.css_first('span[class*="number__"]')
                 if number_elem:
-                    price_text = number_elem.get_text(strip=True)
-                    price = _extract_price(price_text)
+                    price_text = number_elem.text(strip=True)
+                    price = extract_price(price_text)
                 else:
-                    price = _extract_price(price_elem.get_text(strip=True))
+                    price = extract_price(price_elem.text(strip=True))
 
             # Format price string (yen symbol at end)
             if is_auction:
@@ -138,14 +166,14 @@ async def search_products(query: str, limit: int = 3) -> dict:
             else:
                 price_str = f"{price:,}¥"
 
-            products.append(
+            append_product(
                 {
                     "id": item_id,
                     "image": image_url,
                     "name": name[:100],
                     "price": price_str,
                     "link": "View Product",
-                    "url": f"https://jp.mercari.com/item/{item_id}",
+                    "url": _ITEM_URL_PREFIX + item_id,
                 }
             )
 
@@ -160,6 +188,7 @@ async def search_products(query: str, limit: int = 3) -> dict:
         }
 
 
+@lru_cache(maxsize=1)
 def get_tools() -> list[dict[str, Any]]:
     return [
         {
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Optional
 
 
 # Helper functions to convert Anthropic messages to LangChain format
@@ -17,61 +17,71 @@ def create_tool_message(tool_call_id: str, content: str) -> dict:
     return {"type": "tool", "content": content, "tool_call_id": tool_call_id}
 
 
-def convert_langchain_to_anthropic(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
-    anthropic_messages = []
-    i = 0
+# Per-type converters return (anthropic_message | None, next_index) so the
+# grouped tool-result handling can consume several input messages at once
+def _convert_human(messages: list[dict[str, Any]], i: int) -> tuple[Optional[dict], int]:
+    return {"role": "user", "content": messages[i].get("content", "")}, i + 1
 
-    while i < len(messages):
-        msg = messages[i]
-        msg_type = msg.get("type")
 
-        if msg_type == "human":
-            anthropic_messages.append({"role": "user", "content": msg.get("content", "")})
-            i += 1
+def _convert_ai(messages: list[dict[str, Any]], i: int) -> tuple[Optional[dict], int]:
+    msg = messages[i]
+    text_content = msg.get("content", "")
+    tool_calls = msg.get("tool_calls", [])
 
-        elif msg_type == "ai":
-            content = []
-            text_content = msg.get("content", "")
-            if text_content:
-                content.append({"type": "text", "text": text_content})
-
-            tool_calls = msg.get("tool_calls", [])
-            for tc in tool_calls:
-                content.append(
-                    {
-                        "type": "tool_use",
-                        "id": tc.get("id"),
-                        "name": tc.get("name"),
-                        "input": tc.get("args", {}),
-                    }
-                )
-
-            if content:
-                anthropic_messages.append(
-                    {
-                        "role": "assistant",
-                        "content": content if len(content) > 1 or tool_calls else text_content,
-                    }
-                )
-            i += 1
+    content: list[dict[str, Any]] = [{"type": "text", "text": text_content}] if text_content else []
+    content += [
+        {
+            "type": "tool_use",
+            "id": tc.get("id"),
+            "name": tc.get("name"),
+            "input": tc.get("args", {}),
+        }
+        for tc in tool_calls
+    ]
+
+    if not content:
+        return None, i + 1
+    return {
+        "role": "assistant",
+        "content": content if len(content) > 1 or tool_calls else text_content,
+    }, i + 1
+
+
+def _convert_tool(messages: list[dict[str, Any]], i: int) -> tuple[Optional[dict], int]:
+    # Collect consecutive tool messages into a single user message
+    tool_results = []
+    n = len(messages)
+    while i < n and messages[i].get("type") == "tool":
+        tool_msg = messages[i]
+        tool_results.append(
+            {
+                "type": "tool_result",
+                "tool_use_id": tool_msg.get("tool_call_id"),
+                "content": tool_msg.get("content", ""),
+            }
+        )
+        i += 1
+
+    return {"role": "user", "content": tool_results}, i
+
+
+_CONVERTERS = {"human": _convert_human, "ai": _convert_ai, "tool": _convert_tool}
+
+
+def convert_langchain_to_anthropic(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    anthropic_messages: list[dict[str, Any]] = []
+    append = anthropic_messages.append
+    i = 0
+    n = len(messages)
 
-        elif msg_type == "tool":
-            # Collect consecutive tool messages into a single user message
-            tool_results = []
-            while i < len(messages) and messages[i].get("type") == "tool":
-                tool_msg = messages[i]
-                tool_results.append(
-                    {
-                        "type": "tool_result",
-                        "tool_use_id": tool_msg.get("tool_call_id"),
-                        "content": tool_msg.get("content", ""),
-                    }
-                )
-                i += 1
-
-            anthropic_messages.append({"role": "user", "content": tool_results})
-        else:
+    while i < n:
+        converter = _CONVERTERS.get(messages[i].get("type", ""))
+        if converter is None:
             # Skip unknown message types
             i += 1
+            continue
+        entry, i = converter(messages, i)
+        if entry is not None:
+            append(entry)
 
     return anthropic_messages